@@ -5,37 +5,170 @@
 #
 # The function takes an angle x and the number of terms n in the series, and can also accept input in degrees. The function calculates the sin(x) value using the Taylor Series expansion, taking into consideration 1 to n terms in the series. The resulting values are then compared to the sin(x) value obtained using Python's built-in math.sin(x) function, and the absolute difference between these values is displayed.
 #
-# The code handles cases for input angles in degrees or radians, and it also efficiently calculates sin(x) for angles greater than 2 * pi by reducing the input angle to an equivalent angle within the first quadrant (0 to pi/2) to improve the accuracy of the Taylor Series approximation.
+# The code handles cases for input angles in degrees or radians, and it also efficiently calculates sin(x) for angles greater than 2 * pi by reducing the input angle to an equivalent angle within the first quadrant (0 to pi/2), keeping track of the sign of the original quadrant, to improve the accuracy of the Taylor Series approximation.
+#
+# sin_batch(x, n) evaluates the same n-term series for a whole NumPy array of angles at once: the range reduction is done with array operations and the series is evaluated with Horner's scheme using precomputed coefficients. Both share the angle reduction and the coefficient cache of series.py, which also provides cos, tan, exp, sinh and cosh.
+#
+# sin_tolerance(x, tol) adds terms one at a time, each computed from the previous one, and stops once the alternating-series remainder bound drops below tol. convergence_table(x, n) returns the partial sums and errors for 1 to n terms from a single pass, which is what the comparison in main() prints.
+#
+# SinTable is a second backend for hot loops: it tabulates sin and its derivative once on the reduced domain [0, pi/2] and answers queries by cubic Hermite interpolation. Built tables are cached on disk, keyed by their resolution. benchmark() compares its throughput and maximum error with the Taylor path and math.sin.
 
 import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import series
+from series import coefficients, reduce_angle
 
 
 def sin(x, n, degrees=False):
     if degrees:
         x = x * math.pi / 180
 
-    if x >= 2 * math.pi:
-        x = x % (2 * math.pi)
-    if x > math.pi / 2 and x <= math.pi:
-        x = math.pi - x
-    elif x > math.pi and x <= 3 / 2 * math.pi:
-        x = x - math.pi
-    elif x > 3 / 2 * math.pi:
-        x = 2 * math.pi - x
+    x, sign = reduce_angle(x)
     sum = 0
-    count = 0
-    for exp in range(1, 2 * n, 2):
-        sum += (-1) ** count * x ** exp / math.factorial(exp)
-        count = count + 1
-    return sum
+    power = x
+    for c in coefficients('sin', n):
+        sum += c * power
+        power *= x * x
+    return sign * sum
+
+
+# terms x, -x^3/3!, x^5/5!, ... of the series for an already reduced angle
+# every term is obtained from the previous one through the ratio -x^2 / ((2k)(2k + 1))
+def taylor_terms(x):
+    term = x
+    k = 1
+    while True:
+        yield term
+        term *= -x * x / ((2 * k) * (2 * k + 1))
+        k += 1
+
+
+# sin(x) with as many terms as needed to reach the absolute tolerance tol
+# the series is alternating with decreasing terms on [0, pi/2], so the remainder is bounded by the first omitted term
+# returns the value and the number of terms used
+def sin_tolerance(x, tol=1e-12, degrees=False, max_terms=50):
+    if degrees:
+        x = x * math.pi / 180
+
+    x, sign = reduce_angle(x)
+    sum = 0
+    n = 0
+    for term in taylor_terms(x):
+        if abs(term) < tol or n == max_terms:
+            break
+        sum += term
+        n += 1
+    return sign * sum, n
+
+
+# partial sums of the series for 1 to n terms in a single pass
+# returns a list of (number of terms, partial sum, absolute difference from math.sin(x))
+def convergence_table(x, n, degrees=False):
+    if degrees:
+        x = x * math.pi / 180
+
+    exact = math.sin(x)
+    x, sign = reduce_angle(x)
+    table = []
+    sum = 0
+    for count, term in zip(range(1, n + 1), taylor_terms(x)):
+        sum += term
+        table.append((count, sign * sum, abs(exact - sign * sum)))
+    return table
+
+
+# vectorized version of sin() for an ndarray of angles
+def sin_batch(x, n, degrees=False):
+    x = np.asarray(x, dtype=float)
+    if degrees:
+        x = np.deg2rad(x)
+    return series.sin(x, n)
+
+
+# lookup table of sin over [0, pi/2] with cubic Hermite interpolation between the nodes
+class SinTable:
+    def __init__(self, size=1024, cache_dir=None):
+        if size < 2:
+            raise ValueError('size must be at least 2')
+        self.size = size
+        self.step = math.pi / 2 / (size - 1)
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'psm1_sin_tables')
+        path = os.path.join(cache_dir, f'sin_table_{size}.npy')
+        if os.path.exists(path):
+            table = np.load(path)
+        else:
+            table = self.build(size)
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first, so that other processes never load a partially written table
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.npy', delete=False) as file:
+                np.save(file, table)
+            os.replace(file.name, path)
+        # per-interval cubic Hermite polynomials in t = (x - node) / step, highest power first
+        y0, y1 = table[0, :-1], table[0, 1:]
+        m0, m1 = table[1, :-1] * self.step, table[1, 1:] * self.step
+        self.coefficients = (2 * (y0 - y1) + m0 + m1, 3 * (y1 - y0) - 2 * m0 - m1, m0, y0.copy())
+
+    # sin and cos at the nodes, evaluated with the Taylor series to full double precision
+    @staticmethod
+    def build(size):
+        nodes = np.linspace(0, math.pi / 2, size)
+        return np.stack((sin_batch(nodes, 12), sin_batch(math.pi / 2 - nodes, 12)))
+
+    def __call__(self, x, degrees=False):
+        x = np.asarray(x, dtype=float)
+        if degrees:
+            x = np.deg2rad(x)
+
+        x, sign = reduce_angle(x)
+        t = x / self.step
+        # nan (and inf, which reduces to nan) would not cast to a valid index; the result stays nan through t
+        i = np.minimum(np.where(np.isfinite(t), t, 0).astype(np.intp), self.size - 2)
+        t -= i
+        c3, c2, c1, c0 = (np.take(c, i) for c in self.coefficients)
+        result = c3 * t
+        result += c2
+        result *= t
+        result += c1
+        result *= t
+        result += c0
+        result *= sign
+        return result
+
+
+# throughput (angles per second) and maximum error of each backend against math.sin
+def benchmark(count=1_000_000, n=9, size=1024):
+    xs = np.random.default_rng(0).uniform(-100, 100, count)
+    exact = np.sin(xs)
+    table = SinTable(size)
+    # the scalar loops are timed on a slice to keep the benchmark short
+    scalar_count = min(count, 100_000)
+    backends = [
+        ('math.sin', lambda: [math.sin(x) for x in xs[:scalar_count].tolist()], scalar_count),
+        ('sin', lambda: [sin(x, n) for x in xs[:scalar_count].tolist()], scalar_count),
+        ('sin_batch', lambda: sin_batch(xs, n), count),
+        ('SinTable', lambda: table(xs), count),
+    ]
+    for name, run, size in backends:
+        start = time.perf_counter()
+        result = np.asarray(run())
+        elapsed = time.perf_counter() - start
+        error = np.max(np.abs(result - exact[:size]))
+        print(f'{name:>10}: {size / elapsed:14.0f} angles/s, max error {error:.3e}')
 
 
 def main():
     x = math.pi / 2
     print('Wynik math.sin(', x, '): ', math.sin(x))
-    for n in range(1, 10):
-        print('Wynik szeregu Taylora dla ', n, ' pierwszych wyrazów:', sin(x, n))
-        print('Wartość bezwzględna różnicy pomiędzy wynikami: ', abs(math.sin(x) - sin(x, n)))
+    for n, value, error in convergence_table(x, 9):
+        print('Wynik szeregu Taylora dla ', n, ' pierwszych wyrazów:', value)
+        print('Wartość bezwzględna różnicy pomiędzy wynikami: ', error)
 
 
-main()
+if __name__ == '__main__':
+    main()
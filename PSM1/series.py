@@ -0,0 +1,204 @@
+# Title: Taylor series engine
+#
+# Description:
+# This module evaluates sin, cos, tan, exp, sinh and cosh from their Taylor series:
+#
+# sin(x) = x - x^3/3! + x^5/5! - ...        cos(x) = 1 - x^2/2! + x^4/4! - ...
+# sinh(x) = x + x^3/3! + x^5/5! + ...       cosh(x) = 1 + x^2/2! + x^4/4! + ...
+# exp(x) = 1 + x + x^2/2! + x^3/3! + ...
+#
+# The coefficients of each series are computed once and kept in a single memoized table keyed by the function name and the number of terms; the table holds at most CACHE_SIZE entries and evicts the least recently used ones. Every function accepts either a scalar or an array-like of arguments, and arrays can be evaluated in float32 (dtype=np.float32) to halve the memory traffic of large batches.
+#
+# The arguments are first reduced to a small interval (the first quadrant for sin, |r| <= pi/4 around a multiple of pi/2 for cos and tan, |r| <= ln(2) / 2 for exp) and the series is then evaluated with Horner's scheme. The angle reduction of sin is shared with sin() in main.py.
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+CACHE_SIZE = 64
+
+# default number of terms, enough for double precision on the reduced domain of each series
+TERMS = {'sin': 10, 'cos': 10, 'sinh': 9, 'cosh': 10, 'exp': 14}
+
+
+# reduce an angle (a float or an ndarray) to the first quadrant [0, pi/2]
+# returns the reduced angle and the sign of sin(x) for the original quadrant
+def reduce_angle(x):
+    if isinstance(x, np.ndarray):
+        # much faster than np.mod on large arrays, at the cost of a rounding error of order ulp(x)
+        x = x - 2 * math.pi * np.floor(x / (2 * math.pi))
+        lower_half = x < math.pi
+        sign = np.where(lower_half, 1, -1).astype(x.dtype)
+        x = np.where(lower_half, x, x - math.pi)
+        return math.pi / 2 - np.abs(x - math.pi / 2), sign
+
+    x = x % (2 * math.pi)
+    sign = 1
+    if x >= math.pi:
+        x = x - math.pi
+        sign = -1
+    return math.pi / 2 - abs(x - math.pi / 2), sign
+
+
+# pi/2 split into its leading 33 bits and the remainder (as in fdlibm): k * PIO2_HI is exact for |k| < 2^20, so
+# x - k * pi/2 keeps the digits that would be lost to rounding near the multiples of pi/2
+PIO2_HI = 1.57079632673412561417e+00
+PIO2_LO = 6.07710050650619224932e-11
+
+
+# reduce an angle (a float or an ndarray) to r in [-pi/4, pi/4] with x = k * pi/2 + r
+# returns r and the quadrant k mod 4; beyond |k| = 2^20 the split is no longer exact and the angle is first reduced
+# modulo 2 pi as in reduce_angle(), with an error of order ulp(x); nan and inf give r = nan in quadrant 0
+def reduce_quadrant(x):
+    if isinstance(x, np.ndarray):
+        k = np.rint(x * (2 / math.pi))
+        with np.errstate(invalid='ignore'):
+            r = (x - k * PIO2_HI) - k * PIO2_LO
+        large = ~(np.abs(k) < 2 ** 20)
+        if large.any():
+            with np.errstate(invalid='ignore'):
+                y = x[large] - 2 * math.pi * np.floor(x[large] / (2 * math.pi))
+            q = np.rint(y * (2 / math.pi))
+            r[large] = y - q * (math.pi / 2)
+            k[large] = np.where(np.isfinite(q), q, 0)
+        return r, k.astype(np.int64) % 4
+
+    if not math.isfinite(x):
+        return math.nan, 0
+    k = round(x * (2 / math.pi))
+    if abs(k) >= 2 ** 20:
+        x = x % (2 * math.pi)
+        k = round(x * (2 / math.pi))
+        return x - k * (math.pi / 2), k % 4
+    return (x - k * PIO2_HI) - k * PIO2_LO, k % 4
+
+
+# coefficients c_k of the series, in powers of x^2 for sin/cos/sinh/cosh and of x for exp
+# sin(x) = x * sum(c_k x^2k), cos(x) = sum(c_k x^2k), exp(x) = sum(c_k x^k)
+@lru_cache(maxsize=CACHE_SIZE)
+def coefficients(function, n):
+    if function == 'sin':
+        return tuple((-1) ** k / math.factorial(2 * k + 1) for k in range(n))
+    if function == 'cos':
+        return tuple((-1) ** k / math.factorial(2 * k) for k in range(n))
+    if function == 'sinh':
+        return tuple(1 / math.factorial(2 * k + 1) for k in range(n))
+    if function == 'cosh':
+        return tuple(1 / math.factorial(2 * k) for k in range(n))
+    if function == 'exp':
+        return tuple(1 / math.factorial(k) for k in range(n))
+    raise ValueError(f'unknown series: {function}')
+
+
+# evaluate sum(c_k u^k) with Horner's scheme, in place for arrays; no coefficients (n = 0 terms) sum to 0
+def horner(u, coeffs):
+    if not coeffs:
+        return np.zeros_like(u) if isinstance(u, np.ndarray) else 0.0
+    if isinstance(u, np.ndarray):
+        result = np.full_like(u, coeffs[-1])
+        for c in coeffs[-2::-1]:
+            result *= u
+            result += c
+        return result
+
+    result = coeffs[-1]
+    for c in coeffs[-2::-1]:
+        result = result * u + c
+    return result
+
+
+def _as_input(x, dtype):
+    if isinstance(x, (int, float)):
+        return float(x)
+    return np.asarray(x, dtype=dtype)
+
+
+def sin(x, n=None, dtype=np.float64):
+    x = _as_input(x, dtype)
+    r, sign = reduce_angle(x)
+    return sign * r * horner(r * r, coefficients('sin', TERMS['sin'] if n is None else n))
+
+
+# cos(k * pi/2 + r) is cos(r), -sin(r), -cos(r) or sin(r) for k mod 4 = 0, 1, 2, 3; evaluating the series on the
+# reduced r keeps the relative accuracy near the zeros of cos
+def cos(x, n=None, dtype=np.float64):
+    x = _as_input(x, dtype)
+    r, quadrant = reduce_quadrant(x)
+    r2 = r * r
+    c = horner(r2, coefficients('cos', TERMS['cos'] if n is None else n))
+    s = r * horner(r2, coefficients('sin', TERMS['sin'] if n is None else n))
+    if isinstance(x, np.ndarray):
+        return np.choose(quadrant, [c, -s, -c, s])
+    return (c, -s, -c, s)[quadrant]
+
+
+# tan(k * pi/2 + r) is tan(r) for even k and -1 / tan(r) for odd k
+def tan(x, n=None, dtype=np.float64):
+    x = _as_input(x, dtype)
+    r, quadrant = reduce_quadrant(x)
+    r2 = r * r
+    c = horner(r2, coefficients('cos', TERMS['cos'] if n is None else n))
+    s = r * horner(r2, coefficients('sin', TERMS['sin'] if n is None else n))
+    if isinstance(x, np.ndarray):
+        with np.errstate(divide='ignore'):
+            return np.where(quadrant % 2 == 0, s / c, -c / s)
+    return s / c if quadrant % 2 == 0 else -c / s
+
+
+def exp(x, n=None, dtype=np.float64):
+    x = _as_input(x, dtype)
+    # exp(x) = 2^k * exp(r) with r = x - k * ln(2), |r| <= ln(2) / 2
+    if isinstance(x, np.ndarray):
+        # exp overflows above 710 and underflows below -745, so clipping to +-800 keeps k in int32 and still gives
+        # inf and 0 (also for +-inf); nan gets k = 0 and stays nan through r
+        x = np.clip(x, -800, 800)
+        k = np.rint(x / math.log(2))
+        r = x - k * math.log(2)
+        k = np.where(np.isnan(k), 0, k).astype(np.int32)
+        return np.ldexp(horner(r, coefficients('exp', TERMS['exp'] if n is None else n)), k)
+
+    if not math.isfinite(x):
+        return 0.0 if x < 0 else x
+    k = round(x / math.log(2))
+    r = x - k * math.log(2)
+    return math.ldexp(horner(r, coefficients('exp', TERMS['exp'] if n is None else n)), k)
+
+
+# the series is used directly for |x| < 1, where (exp(x) -/+ exp(-x)) / 2 would lose digits to cancellation
+def sinh(x, n=None, dtype=np.float64):
+    x = _as_input(x, dtype)
+    if isinstance(x, np.ndarray):
+        result = exp(x, dtype=dtype)
+        with np.errstate(divide='ignore'):
+            result -= 1 / result
+        result /= 2
+        small = np.abs(x) < 1
+        result[small] = x[small] * horner(x[small] ** 2, coefficients('sinh', TERMS['sinh'] if n is None else n))
+        return result
+
+    if not math.isfinite(x):
+        return x
+    if abs(x) < 1:
+        return x * horner(x * x, coefficients('sinh', TERMS['sinh'] if n is None else n))
+    e = exp(x)
+    return (e - 1 / e) / 2
+
+
+def cosh(x, n=None, dtype=np.float64):
+    x = _as_input(x, dtype)
+    if isinstance(x, np.ndarray):
+        result = exp(x, dtype=dtype)
+        with np.errstate(divide='ignore'):
+            result += 1 / result
+        result /= 2
+        small = np.abs(x) < 1
+        result[small] = horner(x[small] ** 2, coefficients('cosh', TERMS['cosh'] if n is None else n))
+        return result
+
+    if not math.isfinite(x):
+        return abs(x)
+    if abs(x) < 1:
+        return horner(x * x, coefficients('cosh', TERMS['cosh'] if n is None else n))
+    e = exp(x)
+    return (e + 1 / e) / 2
@@ -15,10 +15,43 @@
 #     maximum number of iterations (default value: 10,000)
 #
 # The main function calls both simulate and simulate1 functions with the same initial velocity and launch angle to compare the results of the two numerical methods. The simulation results are displayed as plots, and the total flight time is printed for each method.
+#
+# simulate_batch advances many projectiles at once for parameter sweeps. The state of every projectile is kept in preallocated NumPy arrays, projectiles that hit the ground are dropped from the active set, and only the flight time, range and apex of each shot are returned (no plots). Both Euler's and the improved Euler's update rules are supported.
+#
+# The integrators do not plot anything: they return a Trajectory holding the sampled times, positions and velocities and the flight time. Plotting is done separately by render(), which can draw many trajectories in one figure and save it to a file without a display; matplotlib is only imported when render() is called.
+#
+# For the linear drag the equations of motion have a closed-form solution:
+#
+#     x(t) = vx0 * (1 - e^(-qt)) / q
+#     y(t) = vy0 * (1 - e^(-qt)) / q - g * (qt - 1 + e^(-qt)) / q^2
+#
+# analytic_position evaluates it at any times in O(1) and landing_time finds the root of y(t) = 0 with Newton's method to machine precision. simulate_analytic returns the same flight time, range and apex as simulate_batch without any time stepping; the numerical integrators remain as a cross-check.
+#
+# simulate_adaptive takes the same parameters as simulate and simulate1 but uses the embedded Bogacki-Shampine 3(2) Runge-Kutta pair: h is only the initial step, which is then adapted to keep the local error within the given tolerances. The step that crosses the ground is not dropped; the exact moment of y = 0 is found on the cubic interpolant of the step and the trajectory ends there. accuracy_report compares the number of right-hand side evaluations it needs with simulate1 at a given accuracy.
 
 import math
 
-import matplotlib.pyplot as plt
+import numpy as np
+
+
+# result of a single simulation
+class Trajectory:
+    __slots__ = ('t', 'x', 'y', 'vx', 'vy', 'flight_time', 'evaluations')
+
+    # evaluations is the number of times the right-hand side of the equations of motion was computed
+    def __init__(self, t, x, y, vx, vy, flight_time, evaluations=0):
+        self.t = t
+        self.x = x
+        self.y = y
+        self.vx = vx
+        self.vy = vy
+        self.flight_time = flight_time
+        self.evaluations = evaluations
+
+    # fixed-step result: one evaluation per step
+    @classmethod
+    def from_samples(cls, h, x, y, vx, vy, num_iters):
+        return cls(h * np.arange(len(x)), np.array(x), np.array(y), np.array(vx), np.array(vy), h * num_iters, num_iters)
 
 
 # part 1 - Euler's method
@@ -28,11 +61,12 @@ def simulate(velocity, angle, g=10, drag_coefficient=0.04, h=0.1, max_iters=10_0
     d = drag_coefficient
     v0 = velocity
     vy = [v0 * math.sin(angle), ]
-    vx = [v0 * math.sin(angle), ]
+    vx = [v0 * math.cos(angle), ]
     num_iters = 1
     for n in range(1, max_iters):
         if y[n - 1] < 0:
-            num_iters = n
+            # the sample below the ground was taken after n - 1 steps
+            num_iters = n - 1
             x.pop(-1)
             y.pop(-1)
             vx.pop(-1)
@@ -42,16 +76,7 @@ def simulate(velocity, angle, g=10, drag_coefficient=0.04, h=0.1, max_iters=10_0
         x.append(x[n - 1] + h * vx[n - 1])
         vy.append(vy[n - 1] - h * (g + vy[n - 1] * d))
         y.append(y[n - 1] + h * vy[n - 1])
-    # draw a plot
-    plt.figure(figsize=(20, 10))
-    plt.title('Flight trajectory')
-    plt.plot(x, y)
-    plt.xlabel('distance')
-    plt.ylabel('height')
-    plt.grid()
-    plt.show()
-
-    print('Time of flight = ', h * num_iters, ' seconds')
+    return Trajectory.from_samples(h, x, y, vx, vy, num_iters)
 
 
 # part 2 - improved Euler's method
@@ -61,11 +86,12 @@ def simulate1(velocity, angle, g=10, drag_coefficient=0.04, h=0.1, max_iters=10_
     d = drag_coefficient
     v0 = velocity
     vy = [v0 * math.sin(angle), ]
-    vx = [v0 * math.sin(angle), ]
+    vx = [v0 * math.cos(angle), ]
     num_iters = 1
     for n in range(1, max_iters):
         if y[n - 1] < 0:
-            num_iters = n
+            # the sample below the ground was taken after n - 1 steps
+            num_iters = n - 1
             x.pop(-1)
             y.pop(-1)
             vx.pop(-1)
@@ -84,21 +110,258 @@ def simulate1(velocity, angle, g=10, drag_coefficient=0.04, h=0.1, max_iters=10_
         y.append(yn)
         vx.append(vxn)
         vy.append(vyn)
-    # draw a plot
-    plt.figure(figsize=(20, 10))
-    plt.title('Flight trajectory')
-    plt.plot(x, y)
-    plt.xlabel('distance')
-    plt.ylabel('height')
-    plt.grid()
-    plt.show()
+    return Trajectory.from_samples(h, x, y, vx, vy, num_iters)
+
+
+# part 3 - many projectiles at once
+# velocity, angle and drag_coefficient may be scalars or arrays, they are broadcast against each other
+# returns arrays of flight times, ranges and apex heights; shots still in the air after max_iters get nan time and range
+def simulate_batch(velocity, angle, g=10, drag_coefficient=0.04, h=0.1, max_iters=10_000, method='euler'):
+    if method not in ('euler', 'improved_euler'):
+        raise ValueError(f'unknown method: {method}')
+    velocity, angle, d = np.broadcast_arrays(
+        np.asarray(velocity, dtype=float), np.asarray(angle, dtype=float), np.asarray(drag_coefficient, dtype=float))
+    shape = velocity.shape
+    count = velocity.size
+
+    flight_time = np.full(count, np.nan)
+    distance = np.full(count, np.nan)
+    apex = np.zeros(count)
+
+    # state of the shots still in the air, compacted whenever some of them land
+    active = np.arange(count)
+    d = d.ravel().copy()
+    x = np.zeros(count)
+    y = np.zeros(count)
+    vx = velocity.ravel() * np.cos(angle.ravel())
+    vy = velocity.ravel() * np.sin(angle.ravel())
+    xn = np.empty(count)
+    yn = np.empty(count)
+    vxn = np.empty(count)
+    vyn = np.empty(count)
+
+    for n in range(1, max_iters):
+        # next velocity, the same Euler step for both methods
+        np.multiply(vx, 1 - h * d, out=vxn)
+        np.multiply(vy, 1 - h * d, out=vyn)
+        vyn -= h * g
+        # next position, from the old velocity or from the mean of the old and the new one
+        if method == 'euler':
+            np.multiply(vx, h, out=xn)
+            np.multiply(vy, h, out=yn)
+        else:
+            np.add(vx, vxn, out=xn)
+            xn *= h / 2
+            np.add(vy, vyn, out=yn)
+            yn *= h / 2
+        xn += x
+        yn += y
+
+        landed = yn < 0
+        if landed.any():
+            # like simulate(), the point below the ground is dropped and the range is taken from the last one above it
+            flight_time[active[landed]] = h * n
+            distance[active[landed]] = x[landed]
+            keep = ~landed
+            active = active[keep]
+            if active.size == 0:
+                break
+            d, x, y, vx, vy = d[keep], x[keep], y[keep], vx[keep], vy[keep]
+            xn, yn, vxn, vyn = xn[keep], yn[keep], vxn[keep], vyn[keep]
+
+        apex[active] = np.maximum(apex[active], yn)
+        # the new state becomes the current one, the old arrays are reused as buffers for the next step
+        x, xn = xn, x
+        y, yn = yn, y
+        vx, vxn = vxn, vx
+        vy, vyn = vyn, vy
+
+    return flight_time.reshape(shape), distance.reshape(shape), apex.reshape(shape)
+
+
+# part 4 - closed-form solution for the linear drag
+# (1 - e^(-qt)) / q, which tends to t as q -> 0
+def _decay(d, t):
+    z = d * t
+    safe_d = np.where(d > 0, d, 1)
+    return np.where(d > 0, -np.expm1(-z) / safe_d, t)
+
+
+# (qt - 1 + e^(-qt)) / q^2, which tends to t^2 / 2 as q -> 0
+# a short series is used for small qt, where the direct formula loses digits to cancellation
+def _drop(d, t):
+    z = d * t
+    small = z < 1e-2
+    safe_z = np.where(small, 1, z)
+    series = 0.5 - z / 6 + z ** 2 / 24 - z ** 3 / 120 + z ** 4 / 720 - z ** 5 / 5040
+    direct = (np.expm1(-safe_z) + safe_z) / safe_z ** 2
+    return t ** 2 * np.where(small, series, direct)
+
+
+# position and velocity at times t
+# all arguments are broadcast against each other
+def analytic_position(velocity, angle, t, g=10, drag_coefficient=0.04):
+    d = np.asarray(drag_coefficient, dtype=float)
+    t = np.asarray(t, dtype=float)
+    vx0 = velocity * np.cos(angle)
+    vy0 = velocity * np.sin(angle)
+    decay = _decay(d, t)
+    x = vx0 * decay
+    y = vy0 * decay - g * _drop(d, t)
+    vx = vx0 * np.exp(-d * t)
+    vy = vy0 * np.exp(-d * t) - g * decay
+    return x, y, vx, vy
+
+
+# time at which the projectile returns to y = 0
+# Newton's method starts from the flight time without drag; y(t) is concave and lies below the drag-free parabola,
+# so the iterates approach the root monotonically from the right
+def landing_time(velocity, angle, g=10, drag_coefficient=0.04, max_iters=50):
+    velocity, angle, d = np.broadcast_arrays(
+        np.asarray(velocity, dtype=float), np.asarray(angle, dtype=float), np.asarray(drag_coefficient, dtype=float))
+    t = np.maximum(2 * velocity * np.sin(angle) / g, 0)
+    for _ in range(max_iters):
+        _, y, _, vy = analytic_position(velocity, angle, t, g, d)
+        step = np.where(t > 0, y / np.where(t > 0, vy, 1), 0)
+        t = t - step
+        if np.all(np.abs(step) <= 4 * np.finfo(float).eps * t):
+            break
+    return t
+
+
+# flight time, range and apex of each shot from the closed-form solution, like simulate_batch
+def simulate_analytic(velocity, angle, g=10, drag_coefficient=0.04):
+    velocity, angle, d = np.broadcast_arrays(
+        np.asarray(velocity, dtype=float), np.asarray(angle, dtype=float), np.asarray(drag_coefficient, dtype=float))
+    flight_time = landing_time(velocity, angle, g, d)
+    distance, _, _, _ = analytic_position(velocity, angle, flight_time, g, d)
+    # the vertical velocity vanishes at t = ln(1 + q vy0 / g) / q (vy0 / g without drag)
+    vy0 = np.maximum(velocity * np.sin(angle), 0)
+    apex_time = np.where(d > 0, np.log1p(d * vy0 / g) / np.where(d > 0, d, 1), vy0 / g)
+    _, apex, _, _ = analytic_position(velocity, angle, apex_time, g, d)
+    return flight_time, distance, apex
+
+
+# part 5 - adaptive step size with landing detection
+def _derivatives(state, g, d):
+    x, y, vx, vy = state
+    return vx, vy, -d * vx, -g - d * vy
+
+
+# cubic Hermite interpolation inside a step of length h, at the fraction s of the step
+def _hermite(s, h, y0, y1, dy0, dy1):
+    return ((2 * s ** 3 - 3 * s ** 2 + 1) * y0 + (s ** 3 - 2 * s ** 2 + s) * h * dy0
+            + (3 * s ** 2 - 2 * s ** 3) * y1 + (s ** 3 - s ** 2) * h * dy1)
+
+
+def simulate_adaptive(velocity, angle, g=10, drag_coefficient=0.04, h=0.1, max_iters=10_000, rtol=1e-6, atol=1e-6):
+    d = drag_coefficient
+    state = (0.0, 0.0, velocity * math.cos(angle), velocity * math.sin(angle))
+    t = 0.0
+    ts, xs, ys, vxs, vys = [t], [state[0]], [state[1]], [state[2]], [state[3]]
+    k1 = _derivatives(state, g, d)
+    evaluations = 1
+    flight_time = None
+
+    for _ in range(max_iters):
+        k2 = _derivatives([s + h / 2 * k for s, k in zip(state, k1)], g, d)
+        k3 = _derivatives([s + 3 * h / 4 * k for s, k in zip(state, k2)], g, d)
+        new_state = tuple(s + h * (2 / 9 * a + 1 / 3 * b + 4 / 9 * c) for s, a, b, c in zip(state, k1, k2, k3))
+        k4 = _derivatives(new_state, g, d)
+        evaluations += 3
+
+        # difference between the 3rd and the embedded 2nd order solutions, scaled by the tolerance
+        error = max(abs(h * (-5 / 72 * a + 1 / 12 * b + 1 / 9 * c - 1 / 8 * e)) / (atol + rtol * max(abs(s), abs(n)))
+                    for s, n, a, b, c, e in zip(state, new_state, k1, k2, k3, k4))
+        factor = min(5.0, max(0.2, 0.9 * error ** (-1 / 3))) if error > 0 else 5.0
+        if error > 1:
+            h *= factor
+            continue
+
+        if new_state[1] < 0:
+            # bisection for y = 0 on the interpolant of the step, the derivatives at both ends are k1 and k4
+            low, high = 0.0, 1.0
+            for _ in range(60):
+                middle = (low + high) / 2
+                if _hermite(middle, h, state[1], new_state[1], k1[1], k4[1]) > 0:
+                    low = middle
+                else:
+                    high = middle
+            fraction = (low + high) / 2
+            landing = [_hermite(fraction, h, a, b, da, db) for a, b, da, db in zip(state, new_state, k1, k4)]
+            flight_time = t + fraction * h
+            ts.append(flight_time)
+            xs.append(landing[0])
+            ys.append(0.0)
+            vxs.append(landing[2])
+            vys.append(landing[3])
+            break
+
+        t += h
+        state = new_state
+        # first same as last: the derivatives at the end of this step start the next one
+        k1 = k4
+        ts.append(t)
+        xs.append(state[0])
+        ys.append(state[1])
+        vxs.append(state[2])
+        vys.append(state[3])
+        h *= factor
+
+    return Trajectory(np.array(ts), np.array(xs), np.array(ys), np.array(vxs), np.array(vys), flight_time, evaluations)
+
+
+# flight time and range errors against the closed-form solution, and the evaluations needed to reach them
+def accuracy_report(velocity=40, angle=math.pi / 4, g=10, drag_coefficient=0.04):
+    exact_time = landing_time(velocity, angle, g, drag_coefficient)
+    exact_range, _, _, _ = analytic_position(velocity, angle, exact_time, g, drag_coefficient)
+    runs = [(f'simulate1 h={h}', simulate1(velocity, angle, g, drag_coefficient, h=h, max_iters=10_000_000))
+            for h in (0.1, 0.01, 0.001, 0.0001)]
+    runs += [(f'simulate_adaptive rtol={tol}', simulate_adaptive(velocity, angle, g, drag_coefficient, rtol=tol, atol=tol))
+             for tol in (1e-3, 1e-6, 1e-9)]
+    for name, trajectory in runs:
+        print(f'{name:>30}: time error {abs(trajectory.flight_time - exact_time):.2e} s, '
+              f'range error {abs(trajectory.x[-1] - exact_range):.2e} m, {trajectory.evaluations} evaluations')
+
+
+# draw one or more trajectories in a single figure
+# with filename the figure is saved without opening a window, otherwise it is shown
+def render(trajectories, labels=None, filename=None):
+    if isinstance(trajectories, Trajectory):
+        trajectories = [trajectories]
+    if labels is None:
+        labels = [None] * len(trajectories)
+
+    if filename is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(20, 10))
+    else:
+        # a bare Figure has no GUI backend attached, so it also works on machines without a display
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(20, 10))
+    ax = fig.add_subplot()
+    ax.set_title('Flight trajectory')
+    for trajectory, label in zip(trajectories, labels):
+        ax.plot(trajectory.x, trajectory.y, label=label)
+    ax.set_xlabel('distance')
+    ax.set_ylabel('height')
+    ax.grid()
+    if any(label is not None for label in labels):
+        ax.legend()
 
-    print('Time of flight = ', h * num_iters, ' seconds')
+    if filename is None:
+        plt.show()
+    else:
+        fig.savefig(filename)
 
 
 def main():
-    simulate(40, math.pi / 4)
-    simulate1(40, math.pi / 4)
+    euler = simulate(40, math.pi / 4)
+    improved_euler = simulate1(40, math.pi / 4)
+    print('Time of flight = ', euler.flight_time, ' seconds')
+    print('Time of flight = ', improved_euler.flight_time, ' seconds')
+    print('Exact time of flight = ', landing_time(40, math.pi / 4), ' seconds')
+    render([euler, improved_euler], ["Euler's method", "Improved Euler's method"])
 
 
 if __name__ == '__main__':
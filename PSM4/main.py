@@ -2,6 +2,16 @@
 
 # Description: This Python project simulates the motion of two different rolling objects (a ball and a sphere) on an inclined plane using the Midpoint Method. The simulation calculates the position, rotation angle, and optionally, the potential, kinetic, and total energy of the objects over time. The results of the simulation are visualized in the form of graphs showing the change in position, rotation angle, and energy over time.
 
+# Since the acceleration of a rolling body is constant, roll() computes the motion of any list of bodies (class Body: any moment-of-inertia factor, mass and radius) over the whole time grid in closed form, with numpy arrays instead of a Python loop. Each body stops when it reaches the end of the incline (s = L). The midpoint method is kept in roll_midpoint() to validate the closed-form solution.
+
+# roll_with_slipping() drops the assumption of rolling without slipping: a body rolls while static friction (mu_static) can hold it and slides otherwise, with kinetic friction (mu_kinetic) acting on the slip velocity until it rolls again. The acceleration is constant between the transitions, so the motion is advanced in closed form from one event to the next (rolling/sliding transitions, stopping, the end of the incline) instead of stepping with a small dt.
+
+# sweep() computes the time to the end of the incline on a grid of bodies x incline angles x friction coefficients x slipping factors. Given a file name (for example default_sweep_file() in the temporary directory), the results are stored in an NPZ file, one column per parameter, so a rerun with an extended grid only computes the new cells.
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -14,6 +24,8 @@ I_kuli = (2/5)*m*r**2  # moment of inertia of the ball
 I_sfera = (2/3)*m*r**2  # moment of inertia of the sphere
 mu = 0.01  # rolling friction coefficient
 slipping_factor = 0.1  # introduce slipping factor (0 to 1)
+mu_static = 0.3  # static friction coefficient between the objects and the plane
+mu_kinetic = 0.25  # kinetic friction coefficient, while the objects slide
 
 
 # initial conditions
@@ -29,99 +41,262 @@ dt = 0.001
 t = np.arange(0, t_max, dt)
 
 # midpoint method
-def midpoint_sphere(s, v, beta, omega):
-    # calculate linear acceleration of a ball
-    a_without_friction = g * np.sin(alpha) / (1 + I_sfera / (m * r ** 2))
-    rolling_friction = mu * m * g * np.cos(alpha)
-    a = a_without_friction - rolling_friction / m
-    return midpoint(s, v, beta, omega, a)
-
-def midpoint_ball(s, v, beta, omega):
-    # calculate linear acceleration of a ball
-    a_without_friction = g * np.sin(alpha) / (1 + I_kuli / (m * r ** 2))
-    rolling_friction = mu * m * g * np.cos(alpha)
-    a = a_without_friction - rolling_friction / m
-    return midpoint(s, v, beta, omega, a)
-
-def midpoint(s, v, beta, omega, a):
+def midpoint(s, v, beta, omega, a, dt=dt, r=r):
     # calculate angular acceleration given linear acceleration
     eps = a/r
     # calculate new values of position and velocity using midpoint method
-    s_half = s + v*dt/2
     v_half = v + a*dt/2
     s_new = s + v_half*dt
     v_new = v + a*dt
     # calculate new values of angle of rotation and angular velocity using midpoint method
-    beta_half = beta + omega*dt/2
     omega_half = omega + eps*dt/2
     beta_new = beta + omega_half*dt
     omega_new = omega + eps*dt
-    return (s_new+s_half)/2, (v_new+v_half)/2, (beta_new+beta_half)/2, (omega_new + omega_half)/2
-
-# function to calculate total energy
-def total_energy_sphere(v, s, omega):
-    # calculate kinetic and potential energy for both objects
-    E_sfera = 0.5 * m * v ** 2 + 0.5 * I_sfera * omega ** 2
-    E_pot = m * g * (L - s) * np.sin(alpha)
-    # calculate total energy
-    E_total_sfera = E_sfera + E_pot
-    return E_total_sfera
-
-def total_energy_ball(v, s, omega):
-    # calculate kinetic and potential energy for both objects
-    E_kuli = 0.5 * m * v ** 2 + 0.5 * I_kuli * omega ** 2
-    E_pot = m * g * (L - s) * np.sin(alpha)
-    # calculate total energy
-    E_total_kuli = E_kuli + E_pot
-    return E_total_kuli
+    return s_new, v_new, beta_new, omega_new
+
+# constant linear acceleration along the incline (works on broadcast arrays of parameters)
+# slip is the fraction of the rolling lost to slipping (slipping_factor by default): with slip = 0 the body rolls
+# without slipping, with slip = 1 it slides without rotating
+def acceleration(inertia_factor, alpha=alpha, mu=mu, slip=slipping_factor):
+    a_without_friction = g * np.sin(alpha) / (1 + inertia_factor * (1 - slip))
+    rolling_friction = mu * g * np.cos(alpha)
+    return a_without_friction - rolling_friction
+
+# time of reaching the end of the incline (s = L), the positive root of a/2 t^2 + v0 t - L = 0
+# inf where friction keeps the body from moving
+def time_to_bottom(a, L=L):
+    safe_a = np.where(a > 0, a, 1)
+    return np.where(a > 0, (-v0 + np.sqrt(v0 ** 2 + 2 * safe_a * L)) / safe_a, np.inf)
+
+# a rolling body: the moment of inertia is inertia_factor * m * r^2
+class Body:
+    def __init__(self, name, inertia_factor, m=m, r=r):
+        self.name = name
+        self.inertia_factor = inertia_factor
+        self.m = m
+        self.r = r
+
+    @property
+    def I(self):
+        return self.inertia_factor * self.m * self.r ** 2
+
+    # constant linear acceleration along the incline, from acceleration() with the body's inertia factor
+    def acceleration(self, alpha=alpha, mu=mu, slip=slipping_factor):
+        return acceleration(self.inertia_factor, alpha, mu, slip)
+
+BALL = Body('Kula', 2/5)
+SPHERE = Body('Sfera', 2/3)
+
+# closed-form motion of any number of bodies rolling from the top of the incline (s = 0)
+# every body stops when it reaches the end of the incline (s = L); its state is held from then on
+# returns s, v, beta, omega and the total energy as arrays of shape (number of bodies, len(t)), and the time at
+# which each body reached the end (inf if friction keeps it from moving)
+def roll(bodies, t, alpha=alpha, mu=mu, L=L, slip=slipping_factor):
+    a = np.array([body.acceleration(alpha, mu, slip) for body in bodies])[:, None]
+    m = np.array([body.m for body in bodies])[:, None]
+    r = np.array([body.r for body in bodies])[:, None]
+    I = np.array([body.I for body in bodies])[:, None]
+    a = np.maximum(a, 0)
+    t_end = time_to_bottom(a, L)
+    tau = np.minimum(t, t_end)
+    v = v0 + a * tau
+    s = v0 * tau + a * tau ** 2 / 2
+    eps = a / r * (1 - slip)
+    omega = omega0 + eps * tau
+    beta = beta0 + omega0 * tau + eps * tau ** 2 / 2
+    E_total = 0.5 * m * v ** 2 + 0.5 * I * omega ** 2 + m * g * (L - s) * np.sin(alpha)
+    return s, v, beta, omega, E_total, t_end[:, 0]
+
+# the same motion stepped with the midpoint method, for validation; stops at the step that reaches s = L
+# and returns the time of reaching the end interpolated inside that step, and the sampled s and v
+def roll_midpoint(body, dt=dt, alpha=alpha, mu=mu, L=L, t_max=t_max, slip=slipping_factor):
+    a = max(body.acceleration(alpha, mu, slip), 0)
+    s_list, v_list = [0.0], [float(v0)]
+    beta, omega = beta0, omega0
+    for i in range(1, round(t_max / dt) + 1):
+        s_new, v_new, beta, omega = midpoint(s_list[-1], v_list[-1], beta, omega, a, dt, body.r)
+        if s_new >= L:
+            # event: the end of the incline is crossed in this step
+            s_prev, v_prev = s_list[-1], v_list[-1]
+            tau = (-v_prev + np.sqrt(v_prev ** 2 + 2 * a * (L - s_prev))) / a
+            return (i - 1) * dt + tau, np.array(s_list), np.array(v_list)
+        s_list.append(s_new)
+        v_list.append(v_new)
+    return np.inf, np.array(s_list), np.array(v_list)
+
+# smallest positive time after which a body moving with v and constant a has covered the distance d (inf if never)
+def _time_to_cover(d, v, a):
+    if a == 0:
+        return d / v if v > 0 else np.inf
+    discriminant = v ** 2 + 2 * a * d
+    if discriminant < 0:
+        return np.inf
+    roots = [x for x in ((-v + np.sqrt(discriminant)) / a, (-v - np.sqrt(discriminant)) / a) if x > 0]
+    return min(roots, default=np.inf)
+
+# motion of a body that rolls while static friction can hold it and slides otherwise
+# while rolling (v = omega r) the friction needed to keep rolling is k m a; if that exceeds mu_static m g cos(alpha)
+# the body slides, and kinetic friction mu_kinetic m g cos(alpha) opposes the slip velocity u = v - omega r, speeding
+# up the rotation and slowing down the translation until u = 0, when it rolls again
+# the acceleration is constant between the transitions, so instead of stepping with a small dt the motion is advanced
+# in closed form from one event (rolling -> sliding, sliding -> rolling, stop, end of the incline) to the next
+# returns s, v, beta, omega and the total energy sampled on t, and the list of events as (time, description)
+def roll_with_slipping(body, t, alpha=alpha, mu=mu, mu_static=mu_static, mu_kinetic=mu_kinetic, v0=v0, omega0=omega0,
+                       L=L):
+    k, r = body.inertia_factor, body.r
+    normal = g * np.cos(alpha)
+    # rolling here is rolling without slipping, the slipping comes from the friction limit instead of slipping_factor
+    a_roll = acceleration(k, alpha, mu, 0)
+    can_roll = abs(k * a_roll) <= mu_static * normal
+
+    # segments of constant acceleration: start time, s, v, beta, omega, a, eps
+    segments = []
+    events = []
+    time, s, v, beta, omega = 0.0, 0.0, float(v0), float(beta0), float(omega0)
+    regime = None
+    while time < t[-1]:
+        u = v - omega * r
+        if abs(u) <= 1e-12 * max(abs(v), 1) and can_roll:
+            new_regime = 'toczenie'
+            omega = v / r
+            a = a_roll if v > 0 or a_roll > 0 else 0
+            eps = a / r
+            # rolling resistance stops a body rolling up a too gentle incline
+            t_switch = -v / a if a < 0 else np.inf
+        else:
+            new_regime = 'poślizg'
+            direction = np.sign(u) if u != 0 else 1
+            friction = direction * mu_kinetic * normal
+            a = g * np.sin(alpha) - friction
+            eps = friction / (k * r)
+            du = a - eps * r
+            t_switch = -u / du if u * du < 0 else np.inf
+        if new_regime != regime:
+            events.append((time, new_regime))
+            regime = new_regime
+
+        t_end = _time_to_cover(L - s, v, a)
+        tau = min(t_switch, t_end, t[-1] - time)
+        segments.append((time, s, v, beta, omega, a, eps))
+        s, v = s + v * tau + a * tau ** 2 / 2, v + a * tau
+        beta, omega = beta + omega * tau + eps * tau ** 2 / 2, omega + eps * tau
+        time = float(time + tau)
+        if tau == t_end:
+            events.append((time, 'koniec równi'))
+            break
+        if tau == t_switch and regime == 'toczenie':
+            events.append((time, 'zatrzymanie'))
+            v, omega, a_roll = 0.0, 0.0, 0.0
+    segments.append((time, s, v, beta, omega, 0.0, 0.0))
+
+    # evaluate the segments on the time grid; the state after the last event is held
+    segments = np.array(segments)
+    index = np.searchsorted(segments[:, 0], t, side='right') - 1
+    start, s, v, beta, omega, a, eps = segments[index].T
+    tau = np.where(index < len(segments) - 1, t - start, 0)
+    s = s + v * tau + a * tau ** 2 / 2
+    beta = beta + omega * tau + eps * tau ** 2 / 2
+    v = v + a * tau
+    omega = omega + eps * tau
+    E_total = 0.5 * body.m * v ** 2 + 0.5 * body.I * omega ** 2 + body.m * g * (L - s) * np.sin(alpha)
+    return s, v, beta, omega, E_total, events
+
+# cache file for sweep() in the temporary directory, shared between runs
+def default_sweep_file():
+    cache_dir = os.path.join(tempfile.gettempdir(), 'psm4_sweeps')
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, 'sweep.npz')
+
+def _sweep_chunk(arguments):
+    inertia_factor, alpha, mu, slip, L = arguments
+    return time_to_bottom(acceleration(inertia_factor, alpha, mu, slip), L)
+
+# time to the end of the incline on the full grid bodies x alphas x mus x slips, shape (len(bodies), len(alphas),
+# len(mus), len(slips))
+# with a `filename`, the computed cells are stored as columns (inertia_factor, alpha, mu, slip, L, time) in that NPZ
+# file (default_sweep_file() gives one in the temporary directory); cells already in the file are read from it and
+# only the new ones are computed, in chunks of chunk_size cells on a process pool of `workers` processes (in this
+# process when workers is None)
+def sweep(bodies, alphas, mus, slips, L=L, filename=None, chunk_size=1_000_000, workers=None):
+    inertia_factors = [body.inertia_factor for body in bodies]
+    grid = np.meshgrid(inertia_factors, alphas, mus, slips, indexing='ij')
+    shape = grid[0].shape
+    cells = np.stack([x.ravel() for x in grid] + [np.full(grid[0].size, float(L))], axis=1)
+    if len(cells) == 0:
+        return np.empty(shape)
+
+    if filename is not None and os.path.exists(filename):
+        with np.load(filename) as stored:
+            stored_cells = np.stack([stored[name] for name in ('inertia_factor', 'alpha', 'mu', 'slip', 'L')], axis=1)
+            stored_times = stored['time']
+    else:
+        stored_cells = np.empty((0, 5))
+        stored_times = np.empty(0)
+    # label equal cells with the same number, then look up which labels are already stored
+    all_cells = np.concatenate([stored_cells, cells])
+    order = np.lexsort(all_cells.T[::-1])
+    new_row = np.any(np.diff(all_cells[order], axis=0) != 0, axis=1)
+    labels = np.empty(len(all_cells), dtype=np.int64)
+    labels[order] = np.concatenate([[0], np.cumsum(new_row)])
+    found = np.full(labels.max() + 1, -1)
+    stored_labels, labels = labels[:len(stored_cells)], labels[len(stored_cells):]
+    found[stored_labels] = np.arange(len(stored_cells))
+    found = found[labels]
+
+    times = np.empty(len(cells))
+    times[found >= 0] = stored_times[found[found >= 0]]
+    missing = found < 0
+    new_labels, first, inverse = np.unique(labels[missing], return_index=True, return_inverse=True)
+    if len(new_labels):
+        new_cells = cells[missing][first]
+        chunks = [tuple(new_cells[i:i + chunk_size].T) for i in range(0, len(new_cells), chunk_size)]
+        if workers is None or len(chunks) == 1:
+            new_times = [_sweep_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                new_times = list(pool.map(_sweep_chunk, chunks))
+        new_times = np.concatenate(new_times)
+        times[missing] = new_times[inverse]
+
+        if filename is not None:
+            stored_cells = np.concatenate([stored_cells, new_cells])
+            stored_times = np.concatenate([stored_times, new_times])
+            # written to a temporary file first, so that a concurrent run never reads a partially written file
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(filename)), suffix='.npz',
+                                             delete=False) as file:
+                np.savez(file, inertia_factor=stored_cells[:, 0], alpha=stored_cells[:, 1], mu=stored_cells[:, 2],
+                         slip=stored_cells[:, 3], L=stored_cells[:, 4], time=stored_times)
+            os.replace(file.name, filename)
+    return times.reshape(shape)
+
 def main():
-    # initialize arrays to store the results
-    s_kuli = np.zeros_like(t)
-    v_kuli = np.zeros_like(t)
-    beta_kuli = np.zeros_like(t)
-    omega_kuli = np.zeros_like(t)
-    s_sfera = np.zeros_like(t)
-    v_sfera = np.zeros_like(t)
-    beta_sfera = np.zeros_like(t)
-    omega_sfera = np.zeros_like(t)
-    E_total_kuli = np.zeros_like(t)
-    E_total_sfera = np.zeros_like(t)
-
-    # set initial values of arrays
-    s_kuli[0] = 0
-    v_kuli[0] = v0
-    beta_kuli[0] = beta0
-    omega_kuli[0] = omega0
-    s_sfera[0] = 0
-    v_sfera[0] = v0
-    beta_sfera[0] = beta0
-    omega_sfera[0] = omega0
-    E_total_kuli[0] = total_energy_ball(v0, beta0, omega0)
-    E_total_sfera[0] = total_energy_sphere(v0, beta0, omega0)
-
-    # calculate values using midpoint method
-    for i in range(1, len(t)):
-        s_kuli[i], v_kuli[i], beta_kuli[i], omega_kuli[i] = midpoint_ball(s_kuli[i-1], v_kuli[i-1], beta_kuli[i-1], omega_kuli[i-1])
-        s_sfera[i], v_sfera[i], beta_sfera[i], omega_sfera[i] = midpoint_sphere(s_sfera[i-1], v_sfera[i-1], beta_sfera[i-1], omega_sfera[i-1])
-        E_total_kuli[i], E_total_sfera[i] = total_energy_ball(v_kuli[i], s_kuli[i], omega_kuli[i]), total_energy_sphere(v_sfera[i], s_sfera[i], omega_sfera[i])
+    bodies = [BALL, SPHERE]
+    s, v, beta, omega, E_total, t_end = roll(bodies, t)
+    for body, t_closed in zip(bodies, t_end):
+        t_numerical, _, _ = roll_midpoint(body)
+        print(f'{body.name}: czas staczania {t_closed:.6f} s (metoda midpoint: {t_numerical:.6f} s)')
+    # on a steep incline static friction cannot keep the bodies rolling
+    for body in bodies:
+        _, _, _, _, _, events = roll_with_slipping(body, t, alpha=np.deg2rad(60))
+        print(f'{body.name} (60 deg): ' + ', '.join(f'{name} (t = {time:.4f} s)' for time, name in events))
 
     # plot results
     plt.figure(figsize=(10, 8))
     plt.subplot(3, 1, 1)
-    plt.plot(t, s_kuli, label='Kula')
-    plt.plot(t, s_sfera, label='Sfera')
+    for body, s_body in zip(bodies, s):
+        plt.plot(t, s_body, label=body.name)
     plt.xlabel('Czas [s]')
     plt.ylabel('Położenie [m]')
     plt.legend()
     plt.subplot(3, 1, 2)
-    plt.plot(t, np.rad2deg(beta_kuli), label='Kula')
-    plt.plot(t, np.rad2deg(beta_sfera), label='Sfera')
+    for body, beta_body in zip(bodies, beta):
+        plt.plot(t, np.rad2deg(beta_body), label=body.name)
     plt.xlabel('Czas [s]')
     plt.ylabel('Kąt obrotu [deg]')
     plt.legend()
     plt.subplot(3, 1, 3)
-    plt.plot(t, E_total_kuli, label='Kula')
-    plt.plot(t, E_total_sfera, label='Sfera')
+    for body, E_body in zip(bodies, E_total):
+        plt.plot(t, E_body, label=body.name)
     plt.xlabel('Czas [s]')
     plt.ylabel('Energia [J]')
     plt.legend()
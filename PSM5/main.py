@@ -2,20 +2,83 @@
 
 # Description: The code plots the trajectory of the Moon with respect to the Sun by solving the equations describing the motion of the Earth around the Sun and the Moon with respect to the Earth. Assume Earth moves in a circular orbit, and the Moon moves in a circular orbit with respect to Earth. The improved Euler method (MidPoint) is used to solve the motion equations. This Python program visualizes the trajectories of the Earth and the Moon around the Sun over a year and the distances between the Sun and the Earth/Moon over a year.
 
+# The state of all bodies is kept in contiguous numpy arrays of a System (masses, positions and velocities), and CelestialBody is a view of one row of these arrays. The gravitational accelerations of any number of bodies are computed in one vectorized pass that visits every pair once (Newton's third law), so the same midpoint step works for the sun, the earth and the moon as well as for sets of hundreds of bodies.
+
+# For 10^4 - 10^5 bodies the direct sum (O(N^2)) can be replaced with the Barnes-Hut approximation (System(..., backend='barnes-hut', theta=0.5)). The quadtree (octree in 3D) is rebuilt on every force evaluation and stored in flat numpy arrays, and distant groups of bodies seen under an angle smaller than theta act through their center of mass. benchmark() shows from which N the tree is faster than the direct sum and how the force error depends on theta.
+
+# Besides the midpoint method, System.run() integrates with the symplectic kick-drift-kick leapfrog and the 4th-order Yoshida scheme, which keep the energy error bounded instead of letting it drift, and System.solve() with scipy's adaptive RK45 or DOP853 with dense output. drift_benchmark() compares their energy and angular momentum drift over 100 years against their cost.
+
+# With System(..., workers=k) the direct sum runs on k processes. The masses, positions and accelerations are kept in multiprocessing.shared_memory, so a step only copies the positions into shared memory and sends each worker the bounds of its slice of bodies. scaling_benchmark() measures the speedup from 1 to all cores.
+
+# record() writes the trajectory (every `decimate`-th step) chunk by chunk into a preallocated memory-mapped .npy file instead of Python lists, so long runs with many bodies do not have to fit in memory. The distances are computed from the file afterwards with numpy, and track() reads only as many samples as needed for a plot.
+
 import math
+import os
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
 import matplotlib.pyplot as plt
 
 G = 6.6743 * (10 ** (-11))
 TIME_STEP = 60 * 60 * 24  # 1 day in seconds
 
 
+# a celestial body is a view of one row of the arrays of a System; a body created on its own keeps its state in
+# one-row arrays of its own until it is added to a System
 class CelestialBody:
     def __init__(self, mass, x, y, vx, vy):
-        self.mass = mass
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
+        self.system = None
+        self.index = 0
+        self._masses = np.array([mass], dtype=float)
+        self._positions = np.array([[x, y]], dtype=float)
+        self._velocities = np.array([[vx, vy]], dtype=float)
+
+    def bind(self, system, index):
+        self.system = system
+        self.index = index
+        self._masses = system.masses
+        self._positions = system.positions
+        self._velocities = system.velocities
+
+    @property
+    def mass(self):
+        return float(self._masses[self.index])
+
+    @property
+    def x(self):
+        return float(self._positions[self.index, 0])
+
+    @x.setter
+    def x(self, value):
+        self._positions[self.index, 0] = value
+
+    @property
+    def y(self):
+        return float(self._positions[self.index, 1])
+
+    @y.setter
+    def y(self, value):
+        self._positions[self.index, 1] = value
+
+    @property
+    def vx(self):
+        return float(self._velocities[self.index, 0])
+
+    @vx.setter
+    def vx(self, value):
+        self._velocities[self.index, 0] = value
+
+    @property
+    def vy(self):
+        return float(self._velocities[self.index, 1])
+
+    @vy.setter
+    def vy(self, value):
+        self._velocities[self.index, 1] = value
 
     def distance(self, other):
         return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2)
@@ -28,95 +91,558 @@ class CelestialBody:
         return magnitude * dx, magnitude * dy
 
 
+# indices (i, j) of all pairs i < j of n bodies
+@lru_cache(maxsize=8)
+def pairs(n):
+    return np.triu_indices(n, 1)
+
+
+BLOCK_SIZE = 1024  # bodies per block of the direct sum, bounds its memory to about BLOCK_SIZE^2 pairs
+
+
+# gravitational accelerations of all bodies by direct summation, positions is an (N, 2) or (N, 3) array
+# every pair is visited once and contributes to both bodies with opposite signs (Newton's third law); the pairs are
+# processed block by block, so the memory does not grow as N^2
+def accelerations(positions, masses):
+    n, dim = positions.shape
+    acc = np.zeros_like(positions)
+    for a in range(0, n, BLOCK_SIZE):
+        pa, ma = positions[a:a + BLOCK_SIZE], masses[a:a + BLOCK_SIZE]
+        # pairs inside the block
+        i, j = pairs(len(pa))
+        d = pa[j] - pa[i]
+        r2 = np.einsum('ij,ij->i', d, d)
+        f = d * (G / (r2 * np.sqrt(r2)))[:, None]
+        for k in range(dim):
+            acc[a:a + BLOCK_SIZE, k] += (np.bincount(i, f[:, k] * ma[j], minlength=len(pa))
+                                         - np.bincount(j, f[:, k] * ma[i], minlength=len(pa)))
+        # pairs between the block and the following blocks
+        for b in range(a + BLOCK_SIZE, n, BLOCK_SIZE):
+            pb, mb = positions[b:b + BLOCK_SIZE], masses[b:b + BLOCK_SIZE]
+            d = pb[None, :, :] - pa[:, None, :]
+            r2 = np.einsum('ijk,ijk->ij', d, d)
+            f = d * (G / (r2 * np.sqrt(r2)))[:, :, None]
+            acc[a:a + BLOCK_SIZE] += np.einsum('ijk,j->ik', f, mb)
+            acc[b:b + BLOCK_SIZE] -= np.einsum('ijk,i->jk', f, ma)
+    return acc
+
+
+# accelerations of the bodies at `targets` caused by all bodies, a body at the same position as the target (the target
+# itself) is skipped; the sources are processed block by block
+def target_accelerations(targets, positions, masses):
+    acc = np.zeros_like(targets)
+    for b in range(0, len(positions), BLOCK_SIZE):
+        pb, mb = positions[b:b + BLOCK_SIZE], masses[b:b + BLOCK_SIZE]
+        d = pb[None, :, :] - targets[:, None, :]
+        r2 = np.einsum('ijk,ijk->ij', d, d)
+        r2[r2 == 0] = np.inf
+        acc += np.einsum('ijk,ij->ik', d, G * mb / (r2 * np.sqrt(r2)))
+    return acc
+
+
+# arrays in shared memory, attached once in every worker process
+_shared = {}
+
+
+def _attach(names, n, dim):
+    memories = [SharedMemory(name=name) for name in names]
+    _shared['memories'] = memories
+    _shared['masses'] = np.ndarray((n,), buffer=memories[0].buf)
+    _shared['positions'] = np.ndarray((n, dim), buffer=memories[1].buf)
+    _shared['accelerations'] = np.ndarray((n, dim), buffer=memories[2].buf)
+
+
+def _slice_accelerations(a, b):
+    positions = _shared['positions']
+    _shared['accelerations'][a:b] = target_accelerations(positions[a:b], positions, _shared['masses'])
+
+
+def _release(pool, memories):
+    pool.shutdown()
+    for memory in memories:
+        memory.close()
+        memory.unlink()
+
+
+# direct-sum force evaluation on a pool of `workers` processes
+# masses, positions and accelerations live in shared memory: every call copies the positions into it and the workers
+# write the accelerations of their slice of bodies next to them, so only the slice bounds are sent to the workers
+# the pool and the shared memory are released by close(), at the end of a with block, or at the latest when the object
+# is garbage collected or the interpreter exits
+class SharedForces:
+    def __init__(self, masses, dim, workers):
+        n = len(masses)
+        self.memories = [SharedMemory(create=True, size=max(size, 1) * 8) for size in (n, n * dim, n * dim)]
+        self.masses = np.ndarray((n,), buffer=self.memories[0].buf)
+        self.positions = np.ndarray((n, dim), buffer=self.memories[1].buf)
+        self.accelerations = np.ndarray((n, dim), buffer=self.memories[2].buf)
+        self.masses[:] = masses
+        bounds = np.linspace(0, n, workers + 1).astype(int)
+        self.slices = [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                        initargs=([memory.name for memory in self.memories], n, dim))
+        self._finalizer = weakref.finalize(self, _release, self.pool, self.memories)
+
+    def __call__(self, positions):
+        self.positions[:] = positions
+        for future in [self.pool.submit(_slice_accelerations, a, b) for a, b in self.slices]:
+            future.result()
+        return self.accelerations.copy()
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# quadtree (2D) or octree (3D) of the bodies, stored in flat arrays with one entry per node
+# the bodies are sorted along a Morton (Z-order) curve, so every node holds a contiguous range start:end of them;
+# the children of a node are the nodes child_first:child_first + child_count, leaves have child_first = -1
+class Tree:
+    def __init__(self, positions, masses, leaf_size=8):
+        n, dim = positions.shape
+        self.dim = dim
+        bits = 63 // dim
+        low = positions.min(axis=0)
+        width = float(np.max(positions.max(axis=0) - low)) * (1 + 1e-9) or 1.0
+
+        # Morton keys: the bits of the integer cell coordinates interleaved
+        cells = np.minimum(((positions - low) / width * 2 ** bits).astype(np.int64), 2 ** bits - 1)
+        keys = np.zeros(n, dtype=np.int64)
+        for bit in range(bits):
+            for k in range(dim):
+                keys |= ((cells[:, k] >> bit) & 1) << (bit * dim + k)
+        self.order = np.argsort(keys, kind='stable')
+        keys = keys[self.order]
+        self.positions = positions[self.order]
+        self.masses = masses[self.order]
+
+        # build the tree level by level, splitting nodes with more than leaf_size bodies
+        starts, ends, levels, prefixes, parents = [np.array([0])], [np.array([n])], [0], [np.array([0])], []
+        level = 0
+        split = np.array([0]) if n > leaf_size else np.array([], dtype=np.int64)
+        while len(split) and level < bits:
+            level += 1
+            # the bodies of the nodes being split and their cell prefixes at the new level
+            counts = ends[-1][split] - starts[-1][split]
+            body = np.repeat(starts[-1][split] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            prefix = keys[body] >> (dim * (bits - level))
+            first = np.flatnonzero(np.concatenate([[True], prefix[1:] != prefix[:-1]]))
+            owner = np.repeat(np.arange(len(split)), counts)[first]
+            starts.append(body[first])
+            ends.append(np.concatenate([body[first[1:] - 1] + 1, [body[-1] + 1]]))
+            prefixes.append(prefix[first])
+            levels.append(level)
+            parents.append((split, owner))
+            split = np.flatnonzero(ends[-1] - starts[-1] > leaf_size)
+
+        # flatten the levels
+        offsets = np.cumsum([0] + [len(x) for x in starts])
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.child_first = np.full(len(self.start), -1, dtype=np.int64)
+        self.child_count = np.zeros(len(self.start), dtype=np.int64)
+        for level, (split, owner) in enumerate(parents):
+            children = offsets[level + 1] + np.arange(len(owner))
+            parent = offsets[level] + split[owner]
+            self.child_count += np.bincount(parent, minlength=len(self.start))
+            first_child = np.full(len(self.start), -1, dtype=np.int64)
+            first_child[parent[::-1]] = children[::-1]
+            self.child_first = np.where(first_child >= 0, first_child, self.child_first)
+
+        # mass, center of mass, and cell center and size of every node
+        boundaries = np.stack([self.start, self.end], axis=1).ravel()
+        padded = np.concatenate([self.masses, [0]])
+        self.mass = np.add.reduceat(padded, boundaries)[::2]
+        weighted = np.concatenate([self.positions * self.masses[:, None], np.zeros((1, dim))])
+        self.center_of_mass = np.add.reduceat(weighted, boundaries, axis=0)[::2] / self.mass[:, None]
+        level = np.repeat(np.arange(len(starts)), [len(x) for x in starts])
+        prefix = np.concatenate(prefixes)
+        cell = np.zeros((len(prefix), dim), dtype=np.int64)
+        for bit in range(bits):
+            for k in range(dim):
+                cell[:, k] |= ((prefix >> (bit * dim + k)) & 1) << bit
+        self.size = width / 2.0 ** level
+        self.center = low + (cell + 0.5) * self.size[:, None]
+
+    # accelerations of the (sorted) bodies `body` by a breadth-first walk of the tree done for all of them at once
+    # a node is replaced by its center of mass when it is seen under an angle size / distance < theta and the body
+    # is not inside it, otherwise it is opened; opened leaves are summed directly
+    def accelerations(self, body, theta):
+        P, dim = self.positions, self.dim
+        acc = np.zeros((len(body), dim))
+        local = np.arange(len(body))
+        node = np.zeros(len(body), dtype=np.int64)
+        while len(local):
+            d = self.center_of_mass[node] - P[body[local]]
+            r2 = np.einsum('ij,ij->i', d, d)
+            inside = np.all(np.abs(P[body[local]] - self.center[node]) <= self.size[node, None] / 2, axis=1)
+            accept = (self.size[node] ** 2 < theta ** 2 * r2) & ~inside
+            f = d[accept] * (G * self.mass[node[accept]] / (r2[accept] * np.sqrt(r2[accept])))[:, None]
+            for k in range(dim):
+                acc[:, k] += np.bincount(local[accept], f[:, k], minlength=len(body))
+
+            # opened leaves: direct sum over their bodies, without the body itself
+            leaf = ~accept & (self.child_first[node] < 0)
+            counts = self.end[node[leaf]] - self.start[node[leaf]]
+            source = np.repeat(self.start[node[leaf]] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            target = np.repeat(local[leaf], counts)
+            other = source != body[target]
+            source, target = source[other], target[other]
+            d = P[source] - P[body[target]]
+            r2 = np.einsum('ij,ij->i', d, d)
+            f = d * (G * self.masses[source] / (r2 * np.sqrt(r2)))[:, None]
+            for k in range(dim):
+                acc[:, k] += np.bincount(target, f[:, k], minlength=len(body))
+
+            # opened internal nodes: continue with their children
+            internal = ~accept & (self.child_first[node] >= 0)
+            counts = self.child_count[node[internal]]
+            first = self.child_first[node[internal]]
+            node = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            local = np.repeat(local[internal], counts)
+        return acc
+
+
+# gravitational accelerations with the Barnes-Hut approximation: O(N log N) instead of O(N^2)
+# theta is the opening angle (0 gives the direct sum); the tree is rebuilt on every call and walked for chunk_size
+# bodies at a time to bound the memory
+def barnes_hut_accelerations(positions, masses, theta=0.5, leaf_size=8, chunk_size=4096):
+    tree = Tree(positions, masses, leaf_size)
+    acc = np.empty_like(positions)
+    for a in range(0, len(positions), chunk_size):
+        body = np.arange(a, min(a + chunk_size, len(positions)))
+        acc[tree.order[body]] = tree.accelerations(body, theta)
+    return acc
+
+
+# state of N bodies in contiguous arrays: masses (N,), positions and velocities (N, 2) or (N, 3)
+# backend is 'direct' (exact direct summation) or 'barnes-hut' (tree approximation with the opening angle theta)
+# with workers > 1 the direct sum is evaluated on that many processes (see SharedForces); close() or a with block
+# stops them
+class System:
+    # the state is taken from the bodies, or from the masses, positions and velocities arrays when bodies is None
+    def __init__(self, bodies=None, backend='direct', theta=0.5, workers=None, masses=None, positions=None,
+                 velocities=None):
+        self.backend = backend
+        self.theta = theta
+        self.workers = workers
+        self.parallel = None
+        self.evaluations = 0
+        if bodies is not None:
+            bodies = list(bodies)
+            masses = [body.mass for body in bodies]
+            positions = [[body.x, body.y] for body in bodies]
+            velocities = [[body.vx, body.vy] for body in bodies]
+        self.masses = np.array(masses, dtype=float)
+        self.positions = np.array(positions, dtype=float)
+        self.velocities = np.array(velocities, dtype=float)
+        if bodies is None:
+            bodies = [CelestialBody.__new__(CelestialBody) for _ in range(len(self.masses))]
+        self.bodies = bodies
+        for index, body in enumerate(self.bodies):
+            body.bind(self, index)
+
+    @classmethod
+    def from_arrays(cls, masses, positions, velocities, backend='direct', theta=0.5, workers=None):
+        return cls(None, backend, theta, workers, masses, positions, velocities)
+
+    def accelerations(self, positions=None):
+        positions = self.positions if positions is None else positions
+        self.evaluations += 1
+        if self.backend == 'direct' and self.workers is not None and self.workers > 1:
+            if self.parallel is None:
+                self.parallel = SharedForces(self.masses, positions.shape[1], self.workers)
+            return self.parallel(positions)
+        if self.backend == 'direct':
+            return accelerations(positions, self.masses)
+        if self.backend == 'barnes-hut':
+            return barnes_hut_accelerations(positions, self.masses, self.theta)
+        raise ValueError(f'unknown force backend: {self.backend}')
+
+    def close(self):
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # one step of the improved Euler (midpoint) method, as in midpoint_update_positions()
+    def step(self, dt=TIME_STEP):
+        k1_v = self.accelerations()
+        mid_positions = self.positions + 0.5 * self.velocities * dt
+        mid_velocities = self.velocities + 0.5 * k1_v * dt
+        k2_v = self.accelerations(mid_positions)
+        self.velocities += k2_v * dt
+        self.positions += mid_velocities * dt
+
+    # `steps` steps of dt with the midpoint method or one of the symplectic SPLITTINGS
+    # callback(step), if given, is called after every step with the number of the step (from 1)
+    def run(self, dt=TIME_STEP, steps=1, method='midpoint', callback=None):
+        if method == 'midpoint':
+            for step in range(1, steps + 1):
+                self.step(dt)
+                if callback is not None:
+                    callback(step)
+            return
+        kicks, drifts = SPLITTINGS[method]
+        # the last kick of a step and the first kick of the next one use the same positions
+        acc = self.accelerations()
+        for step in range(1, steps + 1):
+            for i, d in enumerate(kicks):
+                if i > 0:
+                    acc = self.accelerations()
+                self.velocities += d * dt * acc
+                if i < len(drifts):
+                    self.positions += drifts[i] * dt * self.velocities
+            if callback is not None:
+                callback(step)
+
+    # adaptive integration over `duration` seconds with scipy's RK45 or DOP853 (method), with the error kept within
+    # rtol and atol; returns the dense output, a function of the time since the start giving the state vector
+    # (positions.ravel(), velocities.ravel())
+    def solve(self, duration, method='DOP853', rtol=1e-10, atol=1e-6):
+        from scipy.integrate import solve_ivp
+
+        shape = self.positions.shape
+        size = self.positions.size
+
+        def derivatives(_, y):
+            return np.concatenate([y[size:], self.accelerations(y[:size].reshape(shape)).ravel()])
+
+        y0 = np.concatenate([self.positions.ravel(), self.velocities.ravel()])
+        solution = solve_ivp(derivatives, (0, duration), y0, method=method, rtol=rtol, atol=atol, dense_output=True)
+        self.positions[:] = solution.y[:size, -1].reshape(shape)
+        self.velocities[:] = solution.y[size:, -1].reshape(shape)
+        return solution.sol
+
+    def energy(self):
+        kinetic = 0.5 * np.sum(self.masses * np.einsum('ij,ij->i', self.velocities, self.velocities))
+        potential = 0.0
+        n = len(self.masses)
+        for a in range(0, n, BLOCK_SIZE):
+            pa, ma = self.positions[a:a + BLOCK_SIZE], self.masses[a:a + BLOCK_SIZE]
+            i, j = pairs(len(pa))
+            potential -= G * np.sum(ma[i] * ma[j] / np.linalg.norm(pa[j] - pa[i], axis=1))
+            for b in range(a + BLOCK_SIZE, n, BLOCK_SIZE):
+                pb, mb = self.positions[b:b + BLOCK_SIZE], self.masses[b:b + BLOCK_SIZE]
+                potential -= G * np.sum(ma[:, None] * mb[None, :] / np.linalg.norm(pb[None] - pa[:, None], axis=2))
+        return kinetic + potential
+
+    # total angular momentum about the origin (the z component in 2D)
+    def angular_momentum(self):
+        momenta = self.masses[:, None] * self.velocities
+        if self.positions.shape[1] == 2:
+            return np.sum(self.positions[:, 0] * momenta[:, 1] - self.positions[:, 1] * momenta[:, 0])
+        return np.cross(self.positions, momenta).sum(axis=0)
+
+
+# symplectic integrators as alternating kicks (v += d * dt * a) and drifts (x += c * dt * v), starting and ending
+# with a kick: leapfrog is kick-drift-kick, yoshida4 the 4th-order composition of three leapfrog steps
+_W1 = 1 / (2 - 2 ** (1 / 3))
+_W0 = -2 ** (1 / 3) * _W1
+SPLITTINGS = {
+    'leapfrog': ((0.5, 0.5), (1.0,)),
+    'yoshida4': ((_W1 / 2, (_W0 + _W1) / 2, (_W0 + _W1) / 2, _W1 / 2), (_W1, _W0, _W1)),
+}
+
+
+# one midpoint step of the sun, the earth and the moon
 def midpoint_update_positions(sun, earth, moon):
-    fx_earth_moon, fy_earth_moon = earth.force(moon)
-    fx_moon_earth, fy_moon_earth = moon.force(earth)
-    fx_earth_sun, fy_earth_sun = earth.force(sun)
-    fx_moon_sun, fy_moon_sun = moon.force(sun)
-
-    # Compute k1
-    k1_x_earth = earth.vx
-    k1_y_earth = earth.vy
-    k1_vx_earth = (fx_earth_moon + fx_earth_sun) / earth.mass
-    k1_vy_earth = (fy_earth_moon + fy_earth_sun) / earth.mass
-
-    k1_x_moon = moon.vx
-    k1_y_moon = moon.vy
-    k1_vx_moon = (fx_moon_earth + fx_moon_sun) / moon.mass
-    k1_vy_moon = (fy_moon_earth + fy_moon_sun) / moon.mass
-
-    # Compute midpoint values
-    earth_mid_x = earth.x + 0.5 * k1_x_earth * TIME_STEP
-    earth_mid_y = earth.y + 0.5 * k1_y_earth * TIME_STEP
-    earth_mid_vx = earth.vx + 0.5 * k1_vx_earth * TIME_STEP
-    earth_mid_vy = earth.vy + 0.5 * k1_vy_earth * TIME_STEP
-
-    moon_mid_x = moon.x + 0.5 * k1_x_moon * TIME_STEP
-    moon_mid_y = moon.y + 0.5 * k1_y_moon * TIME_STEP
-    moon_mid_vx = moon.vx + 0.5 * k1_vx_moon * TIME_STEP
-    moon_mid_vy = moon.vy + 0.5 * k1_vy_moon * TIME_STEP
-
-    # Temporarily update positions for force calculations
-    earth.x, earth.y = earth_mid_x, earth_mid_y
-    moon.x, moon.y = moon_mid_x, moon_mid_y
-
-    fx_earth_moon, fy_earth_moon = earth.force(moon)
-    fx_moon_earth, fy_moon_earth = moon.force(earth)
-    fx_earth_sun, fy_earth_sun = earth.force(sun)
-    fx_moon_sun, fy_moon_sun = moon.force(sun)
-
-    # Restore original positions
-    earth.x, earth.y = earth_mid_x - 0.5 * k1_x_earth * TIME_STEP, earth_mid_y - 0.5 * k1_y_earth * TIME_STEP
-    moon.x, moon.y = moon_mid_x - 0.5 * k1_x_moon * TIME_STEP, moon_mid_y - 0.5 * k1_y_moon * TIME_STEP
-
-    # Compute k2
-    k2_x_earth = earth_mid_vx
-    k2_y_earth = earth_mid_vy
-    k2_vx_earth = (fx_earth_moon + fx_earth_sun) / earth.mass
-    k2_vy_earth = (fy_earth_moon + fy_earth_sun) / earth.mass
-
-    k2_x_moon = moon_mid_vx
-    k2_y_moon = moon_mid_vy
-    k2_vx_moon = (fx_moon_earth + fx_moon_sun) / moon.mass
-    k2_vy_moon = (fy_moon_earth + fy_moon_sun) / moon.mass
-
-    # Update positions and velocities
-    earth.vx += k2_vx_earth * TIME_STEP
-    earth.vy += k2_vy_earth * TIME_STEP
-    moon.vx += k2_vx_moon * TIME_STEP
-    moon.vy += k2_vy_moon * TIME_STEP
-
-    earth.x += k2_x_earth * TIME_STEP
-    earth.y += k2_y_earth * TIME_STEP
-    moon.x += k2_x_moon * TIME_STEP
-    moon.y += k2_y_moon * TIME_STEP
+    system = sun.system
+    if system is None or earth.system is not system or moon.system is not system:
+        system = System([sun, earth, moon])
+    system.step(TIME_STEP)
 
 
-def main():
+# the sun and n asteroids on circular orbits between 2 and 4 AU, with small vertical offsets in 3D
+def asteroid_belt(n, dim=2, seed=0, backend='direct', theta=0.5, workers=None):
+    rng = np.random.default_rng(seed)
+    radius = rng.uniform(2, 4, n) * 1.496e11
+    phase = rng.uniform(0, 2 * math.pi, n)
+    speed = np.sqrt(G * 1.989e30 / radius)
+    positions = np.zeros((n + 1, dim))
+    velocities = np.zeros((n + 1, dim))
+    positions[1:, 0], positions[1:, 1] = radius * np.cos(phase), radius * np.sin(phase)
+    velocities[1:, 0], velocities[1:, 1] = -speed * np.sin(phase), speed * np.cos(phase)
+    if dim == 3:
+        positions[1:, 2] = rng.normal(0, 0.05, n) * radius
+    masses = np.concatenate([[1.989e30], rng.uniform(1e15, 1e21, n)])
+    return System.from_arrays(masses, positions, velocities, backend, theta, workers)
+
+
+# time of one force evaluation of the direct sum and of Barnes-Hut (theta = 0.5) for growing N, and the
+# relative error of Barnes-Hut against the direct sum for several opening angles
+def benchmark(sizes=(100, 200, 500, 1000, 2000, 5000, 10000, 20000), thetas=(0.2, 0.3, 0.5, 0.7, 1.0), dim=2, error_size=5000):
+    import time
+
+    print('N, direct [s], Barnes-Hut [s]')
+    crossover = None
+    for n in sizes:
+        system = asteroid_belt(n, dim)
+        start = time.perf_counter()
+        accelerations(system.positions, system.masses)
+        direct_time = time.perf_counter() - start
+        start = time.perf_counter()
+        barnes_hut_accelerations(system.positions, system.masses, 0.5)
+        tree_time = time.perf_counter() - start
+        print(f'{n}, {direct_time:.3f}, {tree_time:.3f}')
+        if crossover is None and tree_time < direct_time:
+            crossover = n
+    print(f'Barnes-Hut faster from N = {crossover}' if crossover else 'Barnes-Hut not faster in this range')
+
+    system = asteroid_belt(error_size, dim)
+    exact = accelerations(system.positions, system.masses)
+    print(f'theta, median and max relative force error (N = {error_size})')
+    for theta in thetas:
+        approximate = barnes_hut_accelerations(system.positions, system.masses, theta)
+        error = np.linalg.norm(approximate - exact, axis=1) / np.linalg.norm(exact, axis=1)
+        print(f'{theta}, {np.median(error):.2e}, {error.max():.2e}')
+
+
+# run `steps` steps and record the state every `decimate` steps into the .npy file `filename`, preallocated as a
+# memory-mapped array of shape (samples, 2, N, dim) holding the positions ([:, 0]) and velocities ([:, 1]), with the
+# initial state as the first sample; samples are collected in memory in chunks of chunk_size and written chunk by
+# chunk, so the trajectory never has to fit in memory
+# returns the recorded trajectory opened read-only as a memmap
+def record(system, filename, steps, dt=TIME_STEP, method='midpoint', decimate=1, chunk_size=1024):
+    samples = steps // decimate + 1
+    trajectory = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64,
+                                           shape=(samples, 2) + system.positions.shape)
+    buffer = np.empty((min(chunk_size, samples), 2) + system.positions.shape)
+    written = 0
+    filled = 0
+
+    def store(step):
+        nonlocal written, filled
+        if step % decimate:
+            return
+        buffer[filled, 0] = system.positions
+        buffer[filled, 1] = system.velocities
+        filled += 1
+        if filled == len(buffer) or written + filled == samples:
+            trajectory[written:written + filled] = buffer[:filled]
+            written += filled
+            filled = 0
+
+    store(0)
+    system.run(dt, steps, method, store)
+    trajectory.flush()
+    del trajectory
+    return np.load(filename, mmap_mode='r')
+
+
+# distances between bodies i and j in every sample of a recorded trajectory, computed chunk by chunk
+def distances(trajectory, i, j, chunk_size=65536):
+    result = np.empty(len(trajectory))
+    for a in range(0, len(trajectory), chunk_size):
+        positions = trajectory[a:a + chunk_size, 0]
+        result[a:a + chunk_size] = np.linalg.norm(positions[:, i] - positions[:, j], axis=-1)
+    return result
+
+
+# the positions of body i in a recorded trajectory, with at most max_points samples read from the file
+def track(trajectory, i, max_points=100_000):
+    stride = max(1, -(-len(trajectory) // max_points))
+    return np.array(trajectory[::stride, 0, i])
+
+
+# strong scaling of the parallel direct sum: time of one force evaluation of n bodies on 1, 2, 4, ... and all cores
+# the speedup is measured against the serial accelerations(), which visits every pair once, while the workers
+# compute both directions of every pair for their slice of bodies
+def scaling_benchmark(n=20000, repeats=3, dim=2):
+    import time
+
+    cores = os.cpu_count() or 1
+    counts = sorted({2 ** k for k in range(cores.bit_length()) if 2 ** k <= cores} | {cores})
+    system = asteroid_belt(n, dim)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        accelerations(system.positions, system.masses)
+    reference = (time.perf_counter() - start) / repeats
+    print('workers, time [s], speedup, efficiency')
+    print(f'serial, {reference:.3f}, 1.00, 1.00')
+    for workers in counts:
+        with SharedForces(system.masses, dim, workers) as forces:
+            forces(system.positions)  # start the processes
+            start = time.perf_counter()
+            for _ in range(repeats):
+                forces(system.positions)
+            elapsed = (time.perf_counter() - start) / repeats
+        print(f'{workers}, {elapsed:.3f}, {reference / elapsed:.2f}, {reference / elapsed / workers:.2f}')
+
+
+# the sun, the earth and the moon at the initial positions of the simulation
+def sun_earth_moon():
     earth = CelestialBody(5.972 * (10 ** 24), 147.1 * (10 ** 9), 0, 0, 29.29 * (10 ** 3))
     moon = CelestialBody(7.342 * (10 ** 22), 147.1 * (10 ** 9) + 384.4 * (10 ** 6), 0, 0,
                          29.29 * (10 ** 3) + 1.022 * (10 ** 3))
     sun = CelestialBody(1.989 * (10 ** 30), 0, 0, 0, 0)
+    return System([sun, earth, moon])
+
+
+# energy and angular momentum drift of the sun-earth-moon system over `years` years for every integrator: the fixed
+# step ones with steps given in days, the adaptive ones with the relative tolerance rtol; the drift is the largest
+# relative deviation from the initial value seen at the end of every year
+def drift_benchmark(years=100, fixed=(('midpoint', 1), ('midpoint', 0.25), ('leapfrog', 1), ('leapfrog', 0.25),
+                                      ('yoshida4', 1), ('yoshida4', 0.5)),
+                    adaptive=(('RK45', 1e-10), ('DOP853', 1e-10), ('DOP853', 1e-12))):
+    import time
+
+    year = 365.25 * TIME_STEP
+    print('method, step [days] / rtol, time [s], force evaluations, energy drift, angular momentum drift')
+    for method, days in fixed:
+        system = sun_earth_moon()
+        E0, L0 = system.energy(), system.angular_momentum()
+        steps = round(year / (days * TIME_STEP))
+        energy_drift = momentum_drift = 0.0
+        start = time.perf_counter()
+        for _ in range(years):
+            system.run(year / steps, steps, method)
+            energy_drift = max(energy_drift, abs(system.energy() / E0 - 1))
+            momentum_drift = max(momentum_drift, abs(system.angular_momentum() / L0 - 1))
+        elapsed = time.perf_counter() - start
+        print(f'{method}, {days}, {elapsed:.2f}, {system.evaluations}, {energy_drift:.2e}, {momentum_drift:.2e}')
+
+    for method, rtol in adaptive:
+        system = sun_earth_moon()
+        E0, L0 = system.energy(), system.angular_momentum()
+        start = time.perf_counter()
+        solution = system.solve(years * year, method, rtol)
+        elapsed = time.perf_counter() - start
+        evaluations = system.evaluations
+        energy_drift = momentum_drift = 0.0
+        size = system.positions.size
+        for k in range(1, years + 1):
+            y = solution(k * year)
+            system.positions[:] = y[:size].reshape(system.positions.shape)
+            system.velocities[:] = y[size:].reshape(system.velocities.shape)
+            energy_drift = max(energy_drift, abs(system.energy() / E0 - 1))
+            momentum_drift = max(momentum_drift, abs(system.angular_momentum() / L0 - 1))
+        print(f'{method}, {rtol}, {elapsed:.2f}, {evaluations}, {energy_drift:.2e}, {momentum_drift:.2e}')
+
+
+def main():
+    system = sun_earth_moon()
+    sun, earth, moon = system.bodies
 
     days = 365
-    earth_distances = []
-    moon_distances = []
-    earth_x_positions = []
-    earth_y_positions = []
-    moon_x_positions = []
-    moon_y_positions = []
-
-    for _ in range(days):
-        earth_distances.append(earth.distance(sun))
-        moon_distances.append(moon.distance(sun))
-        earth_x_positions.append(earth.x)
-        earth_y_positions.append(earth.y)
-        moon_x_positions.append(moon.x)
-        moon_y_positions.append(moon.y)
-        midpoint_update_positions(sun, earth, moon)
-
-    plt.plot(earth_x_positions, earth_y_positions, label="Earth's Trajectory")
-    plt.plot(moon_x_positions, moon_y_positions, label="Moon's Trajectory")
+    trajectory = record(system, os.path.join(tempfile.gettempdir(), 'psm5_trajectory.npy'), days - 1)
+    earth_distances = distances(trajectory, earth.index, sun.index)
+    moon_distances = distances(trajectory, moon.index, sun.index)
+
+    earth_positions = track(trajectory, earth.index)
+    moon_positions = track(trajectory, moon.index)
+    plt.plot(earth_positions[:, 0], earth_positions[:, 1], label="Earth's Trajectory")
+    plt.plot(moon_positions[:, 0], moon_positions[:, 1], label="Moon's Trajectory")
     plt.scatter([0], [0], color="yellow", label="Sun")
     plt.xlabel("X Position (m)")
     plt.ylabel("Y Position (m)")